@@ -1,85 +1,486 @@
 import streamlit as st
 from crewai.flow.flow import Flow, start, listen
-from litellm import completion
-import requests
+import litellm
+from litellm import acompletion
+import httpx
+import asyncio
 import json
-from fpdf import FPDF
-import re  # For filtering module headings
+import hashlib
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+from xml.sax.saxutils import escape
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFError, TTFont
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+import re
 
+# API keys are read once from .streamlit/secrets.toml. litellm picks up the
+# Gemini key from the environment, so it is not passed on every call.
+NEWS_KEY = st.secrets["NEWSAPI_KEY"]
+GEMINI_KEY = st.secrets["GEMINI_KEY"]
+os.environ["GEMINI_API_KEY"] = GEMINI_KEY
+
+# On-disk cache for LLM completions, one JSON file per (model, messages) key.
+LLM_CACHE_DIR = Path(".llm_cache")
+LLM_CACHE_TTL = 86400  # seconds
+LLM_CACHE_MAX_ENTRIES = 1000
+
+def cache_key(model, messages, **params):
+    """
+    Build a stable cache key from the model, the chat messages and any
+    extra completion parameters that affect the response.
+    """
+    payload = {"model": model, "messages": messages, **params}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+class CompletionCache:
+    """
+    Persist completion text on disk so identical prompts skip the LLM call.
+    Entries expire after the TTL and the least recently used ones are pruned
+    once the cache holds more than max_entries.
+    """
+    def __init__(self, directory=LLM_CACHE_DIR, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def _path(self, key):
+        return self.directory / f"{key}.json"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+            if time.time() - entry["created"] > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            # The file's mtime records the last use, for LRU pruning.
+            path.touch()
+            return entry["content"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def set(self, key, content):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Write to a unique temp file first so a crash never leaves a truncated
+        # entry and concurrent writers of the same key never share a file.
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.directory, suffix=".tmp", delete=False, encoding="utf-8"
+        ) as tmp_file:
+            json.dump({"created": time.time(), "content": content}, tmp_file)
+        os.replace(tmp_file.name, self._path(key))
+        self._prune()
+
+    def _prune(self):
+        """
+        Delete expired entries, then the least recently used ones beyond max_entries.
+        """
+        now = time.time()
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                last_used = path.stat().st_mtime
+            except OSError:
+                continue
+            # An entry unused for longer than the TTL is necessarily expired.
+            if now - last_used > self.ttl:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((last_used, path))
+        entries.sort(reverse=True)
+        for _, path in entries[self.max_entries:]:
+            path.unlink(missing_ok=True)
+
+llm_cache = CompletionCache()
+
+# Lesson plans are requested in batches of this many modules, with at most
+# MAX_CONCURRENT_COMPLETIONS batches in flight at once.
+PLAN_BATCH_SIZE = 5
+MAX_CONCURRENT_COMPLETIONS = 5
+
+# Transient LLM failures (rate limits, 5xx, dropped connections) are retried
+# with exponential backoff instead of failing the whole flow.
+llm_retry = retry(
+    stop=stop_after_attempt(4),
+    wait=wait_exponential(min=1, max=30),
+    retry=retry_if_exception_type((
+        litellm.RateLimitError,
+        litellm.ServiceUnavailableError,
+        litellm.InternalServerError,
+        litellm.APIConnectionError,
+        litellm.Timeout,
+    )),
+    reraise=True
+)
+
+# Lesson plans shorter than this from the cheaper plan model are
+# regenerated with the outline model.
+MIN_PLAN_CHARS = 200
+
+HTTP_USER_AGENT = "AI-Course-Development-Platform/0.1"
+
+def get_http_client():
+    """
+    Return the HTTP client stored in the Streamlit session, creating it on
+    first use so pooled connections survive reruns.
+    """
+    if "http" not in st.session_state:
+        st.session_state["http"] = httpx.Client(
+            timeout=10,
+            headers={"User-Agent": HTTP_USER_AGENT}
+        )
+    return st.session_state["http"]
+
+# PDF text font: DejaVu Sans when the system provides it (Latin, Greek,
+# Cyrillic, arrows and common symbols), otherwise the Vera font bundled with
+# reportlab (Latin plus typographic punctuation). Neither covers CJK.
+PDF_FONT_FILES = [("DejaVuSans.ttf", "DejaVuSans-Bold.ttf"), ("Vera.ttf", "VeraBd.ttf")]
+
+def _register_pdf_fonts():
+    """
+    Register the first available regular/bold font pair as "CourseSans"
+    and return the set of codepoints both faces can render.
+    """
+    for regular_file, bold_file in PDF_FONT_FILES:
+        try:
+            regular = TTFont("CourseSans", regular_file)
+            bold = TTFont("CourseSans-Bold", bold_file)
+        except TTFError:
+            continue
+        pdfmetrics.registerFont(regular)
+        pdfmetrics.registerFont(bold)
+        return set(regular.face.charToGlyph) & set(bold.face.charToGlyph)
+    raise TTFError("No PDF font found")
+
+PDF_GLYPHS = _register_pdf_fonts()
+
+PDF_TITLE_STYLE = ParagraphStyle(
+    "CourseTitle", fontName="CourseSans-Bold", fontSize=16, leading=20, alignment=TA_CENTER, spaceAfter=10
+)
+PDF_HEADING_STYLE = ParagraphStyle(
+    "ModuleHeading", fontName="CourseSans-Bold", fontSize=14, leading=18, spaceBefore=5, spaceAfter=5
+)
+PDF_BODY_STYLE = ParagraphStyle("ModuleBody", fontName="CourseSans", fontSize=12, leading=15)
+
+def _pdf_text(text):
+    """
+    Replace characters the PDF font has no glyph for with "?", instead of
+    letting them print as blank boxes.
+    """
+    return "".join(ch if ord(ch) in PDF_GLYPHS or ch.isspace() else "?" for ch in text)
+
+def _pdf_paragraph(text, style):
+    """
+    Wrap a single line of plain text in a reportlab Paragraph, escaping markup.
+    """
+    return Paragraph(escape(_pdf_text(text)), style)
+
+# Response format for the course outline: {"modules": [{"title", "description"}]}.
+OUTLINE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "course_outline",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "modules": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "title": {"type": "string"},
+                            "description": {"type": "string"}
+                        },
+                        "required": ["title", "description"]
+                    }
+                }
+            },
+            "required": ["modules"]
+        }
+    }
+}
+
+def parse_outline(text):
+    """
+    Parse a course outline response into a list of {"title", "description"}
+    dicts. Raises ValueError unless it matches OUTLINE_FORMAT with at least
+    one titled module.
+    """
+    parsed = json.loads(text)
+    modules = parsed.get("modules") if isinstance(parsed, dict) else None
+    if not isinstance(modules, list) or not modules:
+        raise ValueError('expected a JSON object with a non-empty "modules" list')
+    outline = []
+    for module in modules:
+        if not isinstance(module, dict) or not isinstance(module.get("title"), str) or not module["title"].strip():
+            raise ValueError("every module needs a non-empty string title")
+        description = module.get("description", "")
+        if not isinstance(description, str):
+            raise ValueError("module descriptions must be strings")
+        outline.append({"title": module["title"].strip(), "description": description.strip()})
+    return outline
+
+def parse_lesson_plans(text, count):
+    """
+    Parse a lesson-plan response: a JSON object mapping every module number
+    "1".."count" to a non-blank Markdown string. Raises ValueError for
+    anything else, matching the required keys of lesson_plans_format.
+    """
+    parsed = json.loads(text)
+    if not isinstance(parsed, dict) or not all(isinstance(plan, str) for plan in parsed.values()):
+        raise ValueError("expected a JSON object mapping module numbers to Markdown strings")
+    missing = [str(i) for i in range(1, count + 1) if not parsed.get(str(i), "").strip()]
+    if missing:
+        raise ValueError(f"missing lesson plans for module numbers {', '.join(missing)}")
+    return parsed
+
+def lesson_plans_format(count):
+    """
+    Build a JSON-schema response format requiring one Markdown lesson plan
+    string per module number 1..count.
+    """
+    numbers = [str(i) for i in range(1, count + 1)]
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "lesson_plans",
+            "schema": {
+                "type": "object",
+                "properties": {number: {"type": "string"} for number in numbers},
+                "required": numbers
+            }
+        }
+    }
+
+def dedupe_modules(modules):
+    """
+    Drop repeated modules, keeping the first occurrence. Modules whose
+    titles only differ by case or whitespace count as duplicates.
+    """
+    seen = set()
+    unique_modules = []
+    for module in modules:
+        key = " ".join(module["title"].split()).casefold()
+        if key not in seen:
+            seen.add(key)
+            unique_modules.append(module)
+    return unique_modules
+
+def filename_slug(subject):
+    """
+    Turn the course subject into a filesystem-safe filename stem,
+    e.g. "C/C++ Basics" -> "C_C_Basics".
+    """
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", subject).strip("_") or "course"
+
+@st.cache_data(show_spinner=False)
+def generate_json_content(subject, lesson_plans):
+    """
+    Serialize the course subject and lesson plans as a JSON document.
+    """
+    course_data = {
+        "subject": subject,
+        "modules": [{"title": module, "lesson_plan": plan} for module, plan in lesson_plans.items()]
+    }
+    return json.dumps(course_data, indent=2)
+
+@st.cache_data(show_spinner=False)
+def generate_markdown_content(subject, lesson_plans):
+    """
+    Generate a Markdown document from the course subject and lesson plans.
+    """
+    # Collect the sections and join once instead of growing a string in a loop.
+    parts = [f"# {subject} Course Curriculum\n\n"]
+    parts.extend(
+        f"## Module {i+1}: {module}\n\n{plan}\n\n"
+        for i, (module, plan) in enumerate(lesson_plans.items())
+    )
+    return "".join(parts)
+
+@st.cache_data(show_spinner=False)
 def generate_pdf_content(subject, lesson_plans):
     """
     Generate a PDF document from the course subject and lesson plans.
     Returns the PDF as a byte string.
     """
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(0, 10, f"{subject} Course Curriculum", ln=True, align="C")
-    pdf.ln(10)
-    pdf.set_font("Arial", size=12)
+    # reportlab writes straight into the buffer, no intermediate string copy.
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, title=f"{subject} Course Curriculum")
+    story = [_pdf_paragraph(f"{subject} Course Curriculum", PDF_TITLE_STYLE), Spacer(1, 10)]
     for i, (module, plan) in enumerate(lesson_plans.items(), start=1):
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, f"Module {i}: {module}", ln=True)
-        pdf.set_font("Arial", size=12)
-        pdf.multi_cell(0, 10, plan)
-        pdf.ln(5)
-    pdf_bytes = pdf.output(dest="S").encode("utf-8")
-    return pdf_bytes
+        story.append(_pdf_paragraph(f"Module {i}: {module}", PDF_HEADING_STYLE))
+        # One Paragraph per line: reportlab re-splits a multi-page Paragraph on
+        # every page break, which makes long plans quadratic to lay out.
+        for line in plan.split("\n"):
+            if line.strip():
+                story.append(_pdf_paragraph(line, PDF_BODY_STYLE))
+            else:
+                story.append(Spacer(1, PDF_BODY_STYLE.leading / 2))
+        story.append(Spacer(1, 5))
+    doc.build(story)
+    return buffer.getvalue()
+
+def describe_http_error(error):
+    """
+    Summarize a failed request for display without echoing the exception
+    text, which includes the request URL.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"HTTP {error.response.status_code}"
+    return type(error).__name__
+
+# External data changes on an hourly timescale, so cache it per subject.
+# The client argument is underscore-prefixed to keep it out of the cache key;
+# failed requests raise and are therefore never cached.
+@st.cache_data(ttl=3600, show_spinner=False)
+def _fetch_news(subject, _client):
+    news_url = "https://newsapi.org/v2/everything"
+    news_params = {
+        "q": subject,
+        "sortBy": "publishedAt",
+        "pageSize": 5
+    }
+    # Send the key as a header so it never appears in the request URL.
+    news_response = _client.get(news_url, params=news_params, headers={"X-Api-Key": NEWS_KEY})
+    news_response.raise_for_status()
+    news_data = news_response.json()
+    return [article["title"] for article in news_data.get("articles", [])]
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _fetch_scholar(subject, _client):
+    url = "https://api.semanticscholar.org/graph/v1/paper/search"
+    params = {
+        "query": subject,
+        "limit": 5,
+        "fields": "title,authors,year,abstract,url"
+    }
+    response = _client.get(url, params=params)
+    response.raise_for_status()
+    data = response.json()
+    return [paper["title"] for paper in data.get("data", [])]
 
 class CourseDevelopmentFlow(Flow):
-    # Use Gemini as the model for LLM generation.
-    model = "gemini/gemini-1.5-flash"
+    # Use Gemini for LLM generation: the flagship model writes the outline,
+    # a smaller, cheaper model drafts the lesson plans.
+    outline_model = "gemini/gemini-1.5-flash"
+    plan_model = "gemini/gemini-1.5-flash-8b"
     
     # Attribute to hold module count.
     module_count = 5
 
+    # Completion cache statistics for the current run.
+    cache_hits = 0
+    cache_misses = 0
+
+    async def _complete(self, model, messages, placeholder=None, validate=None, **params):
+        """
+        Return the completion text for the given messages, serving repeats
+        from the on-disk cache instead of calling the LLM again.
+        When a Streamlit placeholder is given, the response is streamed into it.
+        When validate is given, it must accept the text (raising ValueError
+        otherwise) before the response is cached.
+        """
+        key = cache_key(model, messages, **params)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            if placeholder is not None:
+                self._render(placeholder, cached, params)
+            return cached
+        self.cache_misses += 1
+        if placeholder is not None:
+            content = await self._stream_completion(model, messages, placeholder, **params)
+        else:
+            content = await self._request_completion(model, messages, **params)
+        if validate is not None:
+            # Never cache a malformed response; let the caller handle the error instead.
+            validate(content)
+        llm_cache.set(key, content)
+        return content
+
+    @llm_retry
+    async def _request_completion(self, model, messages, **params):
+        """
+        Request a completion and return its text.
+        """
+        response = await acompletion(
+            model=model,
+            messages=messages,
+            **params
+        )
+        return response["choices"][0]["message"]["content"].strip()
+
+    @llm_retry
+    async def _stream_completion(self, model, messages, placeholder, **params):
+        """
+        Stream a completion into the placeholder as tokens arrive and
+        return the full text.
+        """
+        response = await acompletion(
+            model=model,
+            messages=messages,
+            stream=True,
+            **params
+        )
+        parts = []
+        async for chunk in response:
+            parts.append(chunk.choices[0].delta.content or "")
+            self._render(placeholder, "".join(parts), params)
+        return "".join(parts).strip()
+
+    def _render(self, placeholder, text, params):
+        """
+        Show completion text in a placeholder; JSON-mode responses are shown
+        as code since partial JSON does not render as Markdown.
+        """
+        if "response_format" in params:
+            placeholder.code(text, language="json")
+        else:
+            placeholder.markdown(text)
+
     @start()
     def get_subject(self):
         # These values will be passed in from Streamlit.
         return self.subject_input
 
     @listen(get_subject)
-    def fetch_external_data(self, subject):
-        with st.status("Fetching news data...", expanded=True) as status:
-            news_api_key = "api_key_here"
-            news_url = "https://newsapi.org/v2/everything"
-            news_params = {
-                "q": subject,
-                "sortBy": "publishedAt",
-                "apiKey": news_api_key,
-                "pageSize": 5
-            }
-            try:
-                news_response = requests.get(news_url, params=news_params)
-                news_data = news_response.json()
-                news_articles = [article["title"] for article in news_data.get("articles", [])]
-                status.update(label="News data fetched successfully", state="complete")
-                st.success("News data fetched successfully")
-            except Exception as e:
-                st.error(f"Error fetching news data: {e}")
+    async def fetch_external_data(self, subject):
+        with st.status("Fetching news and Semantic Scholar data...", expanded=True) as status:
+            # Both sources are independent, so fetch them concurrently over the
+            # session's shared client. Streamlit calls stay on this thread.
+            client = get_http_client()
+            news_result, scholar_result = await asyncio.gather(
+                asyncio.to_thread(self.fetch_news_data, client, subject),
+                asyncio.to_thread(self.fetch_semantic_scholar_data, client, subject),
+                return_exceptions=True
+            )
+            if isinstance(news_result, Exception):
+                st.error(f"Error fetching news data: {describe_http_error(news_result)}")
                 news_articles = []
-            
-            status.update(label="Fetching Semantic Scholar data...")
-            scholar_papers = self.fetch_semantic_scholar_data(subject)
+            else:
+                st.success("News data fetched successfully")
+                news_articles = news_result
+            if isinstance(scholar_result, Exception):
+                st.error(f"Error fetching Semantic Scholar data: {describe_http_error(scholar_result)}")
+                scholar_papers = []
+            else:
+                st.success("Semantic Scholar data fetched successfully")
+                scholar_papers = scholar_result
+            status.update(label="External data fetched", state="complete")
             return (news_articles, scholar_papers)
 
-    def fetch_semantic_scholar_data(self, subject):
-        url = "https://api.semanticscholar.org/graph/v1/paper/search"
-        params = {
-            "query": subject,
-            "limit": 5,
-            "fields": "title,authors,year,abstract,url"
-        }
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            papers = [paper["title"] for paper in data.get("data", [])]
-            st.success("Semantic Scholar data fetched successfully")
-            return papers
-        except Exception as e:
-            st.error(f"Error fetching Semantic Scholar data: {e}")
-            return []
+    def fetch_news_data(self, client, subject):
+        return _fetch_news(subject, client)
+
+    def fetch_semantic_scholar_data(self, client, subject):
+        return _fetch_scholar(subject, client)
 
     @listen(fetch_external_data)
     def combine_external_context(self, external_data):
@@ -99,65 +500,140 @@ class CourseDevelopmentFlow(Flow):
             f"News Headlines: {', '.join(news_articles)}. "
             f"Research Papers: {', '.join(scholar_papers)}."
         )
+        # Shared, constant prefix for every completion in this run. Keeping it
+        # first and identical lets Gemini's implicit prefix caching reuse it.
+        self.system_prompt = (
+            f"Context from recent news and scholar papers trends:\n{external_context}\n\n"
+            "You are a curriculum author designing courses informed by this context."
+        )
         return external_context
 
+    def _messages(self, prompt):
+        """
+        Build chat messages with the shared system prefix first and the
+        request-specific prompt last.
+        """
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+
     @listen(combine_external_context)
-    def generate_course_outline(self, external_context):
+    async def generate_course_outline(self, external_context):
         with st.status("Generating course outline...", expanded=True) as status:
             prompt = (
-                f"Using the following context from recent news and scholar papers trends:\n"
-                f"{external_context}\n\n"
                 f"Generate a comprehensive course outline on the subject '{self.subject_input}' with {self.module_count} modules. "
-                "Each module should have a title and a brief description, formatted as a numbered list (e.g., '1. Module Title: Description')."
+                "Each module should have a title and a brief description. "
+                'Return JSON: {"modules": [{"title": "...", "description": "..."}]}'
             )
-            response = completion(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                api_key="api_key"
-            )
-            outline = response["choices"][0]["message"]["content"].strip()
-            status.update(label="Course outline generated", state="complete")
+            try:
+                response = await self._complete(
+                    self.outline_model,
+                    self._messages(prompt),
+                    placeholder=st.empty(),
+                    validate=parse_outline,
+                    response_format=OUTLINE_FORMAT
+                )
+                outline = parse_outline(response)
+            except ValueError as e:
+                st.error(f"The course outline could not be read: {e}. Please try again.")
+                status.update(label="Course outline generation failed", state="error")
+                return []
+            status.update(label="Course outline generated", state="complete", expanded=False)
             return outline
 
+    async def _generate_plan_batch(self, batch, semaphore):
+        """
+        Generate lesson plans for a batch of modules with the plan model,
+        regenerating any that come back too short with the outline model.
+        """
+        lesson_plans = await self._request_plans(self.plan_model, batch, semaphore)
+        short_modules = [module for module in batch if len(lesson_plans[module["title"]]) < MIN_PLAN_CHARS]
+        if short_modules:
+            fallback_plans = await self._request_plans(self.outline_model, short_modules, semaphore)
+            lesson_plans.update({title: plan for title, plan in fallback_plans.items() if plan})
+        missing = [module["title"] for module in batch if not lesson_plans[module["title"]]]
+        if missing:
+            st.warning(f"No lesson plan could be generated for: {', '.join(missing)}")
+        return lesson_plans
+
+    async def _request_plans(self, model, batch, semaphore):
+        """
+        Generate lesson plans for a batch of modules in a single JSON-mode
+        completion and return them keyed by module title. A malformed
+        response yields empty plans, so the caller can fall back.
+        """
+        module_list = "\n".join(
+            f"{i}. {module['title']}: {module['description']}"
+            for i, module in enumerate(batch, start=1)
+        )
+        prompt = (
+            "Generate a detailed lesson plan for EACH of the following course modules. "
+            "Include key topics, activities, and suggested resources.\n"
+            "Return a JSON object mapping each module number (as a string) to its lesson plan, "
+            "written as a single Markdown string.\n"
+            f"Modules:\n{module_list}"
+        )
+        try:
+            async with semaphore:
+                response = await self._complete(
+                    model,
+                    self._messages(prompt),
+                    validate=lambda text: parse_lesson_plans(text, len(batch)),
+                    response_format=lesson_plans_format(len(batch))
+                )
+            parsed = parse_lesson_plans(response, len(batch))
+        except ValueError:
+            parsed = {}
+        return {
+            module["title"]: parsed.get(str(i), "").strip()
+            for i, module in enumerate(batch, start=1)
+        }
+
     @listen(generate_course_outline)
-    def generate_lesson_plans(self, outline):
-        st.subheader("Course Outline")
-        st.markdown(outline)
-        
-        # Split the outline into lines.
-        lines = [line.strip() for line in outline.split("\n") if line.strip()]
-        # Filter lines that match a numbered module format (e.g., "1. Module Title: Description").
-        modules = [line for line in lines if re.match(r"^\d+\.", line)]
+    async def generate_lesson_plans(self, modules):
         if not modules:
-            modules = lines
+            return {}
+        # The LLM sometimes repeats headings; never pay for the same lesson plan twice.
+        modules = dedupe_modules(modules)
+        
+        st.subheader("Course Outline")
+        st.markdown("\n".join(
+            f"{i}. **{module['title']}**: {module['description']}"
+            for i, module in enumerate(modules, start=1)
+        ))
         
         # Let the user select which modules they want detailed lesson plans for.
-        selected_modules = st.multiselect(
+        modules_by_title = {module["title"]: module for module in modules}
+        selected_titles = st.multiselect(
             "Select modules for detailed lesson plans:",
-            modules,
-            default=modules
+            list(modules_by_title),
+            default=list(modules_by_title)
         )
+        selected_modules = [modules_by_title[title] for title in selected_titles]
         
         lesson_plans = {}
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        for i, module in enumerate(selected_modules):
-            status_text.text(f"Generating lesson plan for module {i+1}/{len(selected_modules)}")
-            prompt = (
-                f"Based on the course module: '{module}', generate a detailed lesson plan. "
-                "Include key topics, activities, and suggested resources."
-            )
-            response = completion(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                api_key="api_key"
-            )
-            lesson_plan = response["choices"][0]["message"]["content"].strip()
-            lesson_plans[module] = lesson_plan
-            progress_bar.progress((i + 1) / len(selected_modules))
+        # Batch several modules per prompt and run the batches concurrently.
+        batches = [
+            selected_modules[i:i + PLAN_BATCH_SIZE]
+            for i in range(0, len(selected_modules), PLAN_BATCH_SIZE)
+        ]
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_COMPLETIONS)
+        status_text.text(f"Generating lesson plans for {len(selected_modules)} modules")
+        tasks = [self._generate_plan_batch(batch, semaphore) for batch in batches]
+        for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+            batch_plans = await task
+            lesson_plans.update(batch_plans)
+            progress_bar.progress(done / len(batches))
+            status_text.text(f"Generated lesson plans for {len(lesson_plans)}/{len(selected_modules)} modules")
+        # Keep the plans in the order the modules were selected.
+        lesson_plans = {title: lesson_plans[title] for title in selected_titles}
         
         status_text.text("All lesson plans generated!")
+        st.caption(f"LLM cache: {self.cache_hits} hits, {self.cache_misses} misses")
         return lesson_plans
 
 def main():
@@ -183,6 +659,8 @@ def main():
         with st.spinner("Creating your course..."):
             st.subheader("Course Development Process")
             lesson_plans = flow.kickoff()
+        if not lesson_plans:
+            return
         
         st.subheader("Detailed Lesson Plans")
         for i, (module, plan) in enumerate(lesson_plans.items()):
@@ -190,36 +668,30 @@ def main():
                 st.markdown(plan)
         
         st.subheader("Export Course Materials")
-        course_data = {
-            "subject": subject_input,
-            "modules": [{"title": module, "lesson_plan": plan} for module, plan in lesson_plans.items()]
-        }
-        
+        # Export builders are cached, so reruns with the same plans reuse them.
+        slug = filename_slug(subject_input)
         col1, col2, col3 = st.columns(3)
         with col1:
             st.download_button(
                 label="Download JSON",
-                data=json.dumps(course_data, indent=2),
-                file_name=f"{subject_input.replace(' ', '_')}_course.json",
+                data=generate_json_content(subject_input, lesson_plans),
+                file_name=f"{slug}_course.json",
                 mime="application/json"
             )
         with col2:
-            markdown_content = f"# {subject_input} Course Curriculum\n\n"
-            for i, (module, plan) in enumerate(lesson_plans.items()):
-                markdown_content += f"## Module {i+1}: {module}\n\n{plan}\n\n"
             st.download_button(
                 label="Download Markdown",
-                data=markdown_content,
-                file_name=f"{subject_input.replace(' ', '_')}_course.md",
+                data=generate_markdown_content(subject_input, lesson_plans),
+                file_name=f"{slug}_course.md",
                 mime="text/markdown"
             )
         with col3:
-            # Generate the PDF once and provide a persistent download button.
+            # Generate the PDF once per set of plans and provide a persistent download button.
             pdf_bytes = generate_pdf_content(subject_input, lesson_plans)
             st.download_button(
                 label="Download PDF",
                 data=pdf_bytes,
-                file_name=f"{subject_input.replace(' ', '_')}_course.pdf",
+                file_name=f"{slug}_course.pdf",
                 mime="application/pdf"
             )
 